@@ -1,7 +1,7 @@
 import os
 
 from flask import Flask
-from app.extensions import db
+from app.extensions import db, admission, hot_cache
 
 
 def create_app():
@@ -10,14 +10,23 @@ def create_app():
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///test.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['BASE_UPLOAD_DIR'] = 'artefacts'
+    app.config['ADMISSION_LIMITS'] = {
+        'upload': {'max_concurrency': 8, 'max_concurrency_per_client': 2},
+        'download': {'max_concurrency': 64, 'max_concurrency_per_client': 8},
+    }
 
     db.init_app(app)
+    admission.init_app(app)
+    hot_cache.init_app(app)
     os.makedirs(app.config['BASE_UPLOAD_DIR'], exist_ok=True)
 
     with app.app_context():
-        from app.models import Artefact
+        from app.models import Artefact, Change
         db.create_all()
 
+        from app.changes import change_feed
+        change_feed.init_app(app)
+
         from app.routes import main
         app.register_blueprint(main)
 
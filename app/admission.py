@@ -0,0 +1,243 @@
+import math
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from flask import current_app, jsonify, request
+from werkzeug.wsgi import ClosingIterator
+
+
+DEFAULT_LIMITS = {
+    'max_concurrency': None,
+    'max_concurrency_per_client': None,
+    'bytes_per_second': None,
+    'bytes_per_second_per_client': None,
+}
+
+
+class TokenBucket:
+    """Byte budget refilled at a fixed rate, allowed to go into debt."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def retry_after(self):
+        """Seconds until the bucket is out of debt, 0 if it can admit now."""
+
+        self._refill()
+        if self.tokens > 0:
+            return 0
+        return max(1, math.ceil(-self.tokens / self.rate))
+
+    def is_full(self):
+        self._refill()
+        return self.tokens >= self.rate
+
+    def consume(self, amount):
+        self._refill()
+        self.tokens -= amount
+
+
+class AdmissionController:
+    """Concurrency and byte-rate limits per endpoint class and per client.
+
+    Limits are read from ``ADMISSION_LIMITS``, a mapping of endpoint class
+    (e.g. ``'upload'``) to the keys in ``DEFAULT_LIMITS``. ``None`` means
+    unlimited. Byte rates are charged with the request body for classes
+    admitted with ``charge='request'`` and with the response body
+    otherwise. Requests over a global limit get a 503, requests over a
+    per-client limit get a 429, both with a ``Retry-After`` header.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ADMISSION_LIMITS', {})
+        app.config.setdefault('ADMISSION_RETRY_AFTER', 1)
+        app.config.setdefault('ADMISSION_SWEEP_INTERVAL', 60)
+        app.extensions['admission'] = {
+            'lock': threading.Lock(),
+            'active': Counter(),
+            'active_per_client': {},
+            'buckets': {},
+            'swept_at': time.monotonic(),
+        }
+
+    @staticmethod
+    def _state():
+        return current_app.extensions['admission']
+
+    @staticmethod
+    def _limits(endpoint_class):
+        limits = dict(DEFAULT_LIMITS)
+        limits.update(current_app.config['ADMISSION_LIMITS'].get(endpoint_class, {}))
+        return limits
+
+    @staticmethod
+    def _bucket(state, key, rate):
+        bucket = state['buckets'].get(key)
+        if bucket is None or bucket.rate != rate:
+            bucket = state['buckets'][key] = TokenBucket(rate)
+        return bucket
+
+    @staticmethod
+    def _sweep(state):
+        """Drop buckets that have refilled, so idle clients do not accumulate."""
+
+        now = time.monotonic()
+        if now - state['swept_at'] < current_app.config['ADMISSION_SWEEP_INTERVAL']:
+            return
+        state['swept_at'] = now
+        for key, bucket in list(state['buckets'].items()):
+            if bucket.is_full():
+                del state['buckets'][key]
+
+    def _reject(self, status, message, retry_after=None):
+        response = jsonify(error=message)
+        response.status_code = status
+        if retry_after is not None:
+            response.headers['Retry-After'] = str(retry_after)
+        return response
+
+    def _acquire(self, endpoint_class, client, charge):
+        """Take a slot for the request, or return the rejection response."""
+
+        limits = self._limits(endpoint_class)
+        state = self._state()
+        retry_after = current_app.config['ADMISSION_RETRY_AFTER']
+
+        with state['lock']:
+            per_client = state['active_per_client'].setdefault(endpoint_class, Counter())
+
+            if limits['max_concurrency'] is not None \
+                    and state['active'][endpoint_class] >= limits['max_concurrency']:
+                return self._reject(503, f"Too many concurrent {endpoint_class} requests", retry_after)
+
+            if limits['max_concurrency_per_client'] is not None \
+                    and per_client[client] >= limits['max_concurrency_per_client']:
+                return self._reject(429, f"Too many concurrent {endpoint_class} requests from client", retry_after)
+
+            buckets = []
+            if limits['bytes_per_second'] is not None:
+                bucket = self._bucket(state, (endpoint_class, None), limits['bytes_per_second'])
+                wait = bucket.retry_after()
+                if wait:
+                    return self._reject(503, f"{endpoint_class.capitalize()} byte rate exceeded", wait)
+                buckets.append(bucket)
+
+            if limits['bytes_per_second_per_client'] is not None:
+                bucket = self._bucket(state, (endpoint_class, client), limits['bytes_per_second_per_client'])
+                wait = bucket.retry_after()
+                if wait:
+                    return self._reject(429, f"{endpoint_class.capitalize()} byte rate exceeded for client", wait)
+                buckets.append(bucket)
+
+            if charge == 'request' and buckets:
+                if request.content_length is None:
+                    return self._reject(411, "Content-Length required")
+                # Charged up front so the body is never read for a rejected request.
+                for bucket in buckets:
+                    bucket.consume(request.content_length)
+
+            state['active'][endpoint_class] += 1
+            per_client[client] += 1
+
+        return None
+
+    def _charge_response(self, endpoint_class, client, sent_bytes):
+        """Charge the size of a response before its body is sent."""
+
+        limits = self._limits(endpoint_class)
+        state = self._state()
+
+        with state['lock']:
+            if limits['bytes_per_second'] is not None:
+                self._bucket(state, (endpoint_class, None), limits['bytes_per_second']).consume(sent_bytes)
+            if limits['bytes_per_second_per_client'] is not None:
+                self._bucket(
+                    state, (endpoint_class, client), limits['bytes_per_second_per_client']
+                ).consume(sent_bytes)
+
+    def _release(self, endpoint_class, client):
+        state = self._state()
+
+        with state['lock']:
+            state['active'][endpoint_class] -= 1
+            per_client = state['active_per_client'][endpoint_class]
+            per_client[client] -= 1
+            if per_client[client] <= 0:
+                del per_client[client]
+
+            self._sweep(state)
+
+    def limit(self, endpoint_class, charge='request'):
+        """Decorate a view so it is admitted against the limits of ``endpoint_class``.
+
+        ``charge`` is ``'request'`` to count the request's Content-Length
+        against the byte rate, or ``'response'`` to count the bytes sent.
+
+        Streamed file responses hold their slot until the body has been sent,
+        so downloads count towards occupancy for their whole duration.
+        """
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                client = request.remote_addr or 'unknown'
+                rejection = self._acquire(endpoint_class, client, charge)
+                if rejection is not None:
+                    return rejection
+
+                try:
+                    response = current_app.make_response(view(*args, **kwargs))
+                except Exception:
+                    self._release(endpoint_class, client)
+                    raise
+
+                # Charged as soon as the size is known, so streams still in flight count.
+                if charge == 'response' and response.content_length:
+                    self._charge_response(endpoint_class, client, response.content_length)
+
+                if not response.direct_passthrough:
+                    self._release(endpoint_class, client)
+                    return response
+
+                # Streamed files hold their slot until the server closes the body.
+                app = current_app._get_current_object()
+
+                def release():
+                    with app.app_context():
+                        self._release(endpoint_class, client)
+
+                response.response = ClosingIterator(response.response, release)
+                return response
+
+            return wrapper
+
+        return decorator
+
+    def occupancy(self):
+        """Current in-flight requests and limits for every endpoint class."""
+
+        state = self._state()
+        classes = set(current_app.config['ADMISSION_LIMITS']) | set(state['active'])
+
+        with state['lock']:
+            return {
+                endpoint_class: {
+                    'active': state['active'][endpoint_class],
+                    'active_per_client': dict(state['active_per_client'].get(endpoint_class, {})),
+                    'limits': self._limits(endpoint_class),
+                }
+                for endpoint_class in sorted(classes)
+            }
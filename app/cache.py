@@ -0,0 +1,142 @@
+import hashlib
+import mimetypes
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import Response, current_app, request
+
+
+class HotFileCache:
+    """In-memory LRU cache of small artefact files, keyed by artefact id.
+
+    Files up to ``HOT_CACHE_MAX_FILE_SIZE`` bytes are read once and kept as
+    bytes, together with their SHA-256 digest (served as the ETag), until the
+    total size would exceed ``HOT_CACHE_MAX_BYTES``. Cache hits skip path
+    resolution and file I/O, so entries must be invalidated by every route
+    that replaces or removes a file. Every invalidation bumps a generation
+    counter, and a file read concurrently with one is not cached. Entries
+    also record the artefact's ``uploaded_at``, so a replace made by another
+    process is noticed on the next hit.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('HOT_CACHE_MAX_FILE_SIZE', 64 * 1024)
+        app.config.setdefault('HOT_CACHE_MAX_BYTES', 16 * 1024 * 1024)
+        app.extensions['hot_cache'] = {
+            'lock': threading.Lock(),
+            'entries': OrderedDict(),
+            'size': 0,
+            'generation': 0,
+        }
+
+    @staticmethod
+    def _state():
+        return current_app.extensions['hot_cache']
+
+    def _load(self, artefact_id, path, uploaded_at, file_path):
+        """Read a file and cache it, or return None if it is not cacheable.
+
+        The entry is returned but not cached if the cache was invalidated
+        while the file was being read.
+        """
+
+        max_file_size = current_app.config['HOT_CACHE_MAX_FILE_SIZE']
+        max_bytes = current_app.config['HOT_CACHE_MAX_BYTES']
+
+        state = self._state()
+        with state['lock']:
+            generation = state['generation']
+
+        try:
+            stat = file_path.stat()
+            if stat.st_size > max_file_size or stat.st_size > max_bytes:
+                return None
+            data = file_path.read_bytes()
+        except OSError:
+            return None
+
+        entry = {
+            'path': path,
+            'uploaded_at': uploaded_at,
+            'data': data,
+            'digest': hashlib.sha256(data).hexdigest(),
+            'mimetype': mimetypes.guess_type(file_path.name)[0] or 'application/octet-stream',
+            'last_modified': datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+        }
+
+        with state['lock']:
+            if state['generation'] != generation:
+                # The file may have been replaced while it was read.
+                return entry
+            old = state['entries'].pop(artefact_id, None)
+            if old is not None:
+                state['size'] -= len(old['data'])
+            while state['entries'] and state['size'] + len(data) > max_bytes:
+                _, evicted = state['entries'].popitem(last=False)
+                state['size'] -= len(evicted['data'])
+            state['entries'][artefact_id] = entry
+            state['size'] += len(data)
+
+        return entry
+
+    @staticmethod
+    def _response(entry):
+        response = Response(entry['data'], mimetype=entry['mimetype'])
+        response.set_etag(entry['digest'])
+        response.last_modified = entry['last_modified']
+        return response.make_conditional(request, accept_ranges=True, complete_length=len(entry['data']))
+
+    def get(self, artefact_id, path, uploaded_at):
+        """Return a response for a cached artefact, or None on a miss.
+
+        Entries are only stored after the caller has validated the file path,
+        so a hit needs no path resolution or file I/O.
+        """
+
+        state = self._state()
+        with state['lock']:
+            entry = state['entries'].get(artefact_id)
+            if entry is None or entry['path'] != path or entry['uploaded_at'] != uploaded_at:
+                return None
+            state['entries'].move_to_end(artefact_id)
+
+        return self._response(entry)
+
+    def serve(self, artefact_id, path, uploaded_at, file_path):
+        """Load an artefact into the cache and return a response for it.
+
+        Returns None when the file is too large to cache or cannot be read,
+        in which case the caller should fall back to streaming it.
+        """
+
+        entry = self._load(artefact_id, path, uploaded_at, file_path)
+        if entry is None:
+            return None
+
+        return self._response(entry)
+
+    def invalidate(self, artefact_id):
+        """Drop the cached file of an artefact."""
+
+        state = self._state()
+        with state['lock']:
+            state['generation'] += 1
+            entry = state['entries'].pop(artefact_id, None)
+            if entry is not None:
+                state['size'] -= len(entry['data'])
+
+    def invalidate_path(self, path):
+        """Drop every cached artefact stored at ``path``."""
+
+        state = self._state()
+        with state['lock']:
+            state['generation'] += 1
+            for artefact_id, entry in list(state['entries'].items()):
+                if entry['path'] == path:
+                    del state['entries'][artefact_id]
+                    state['size'] -= len(entry['data'])
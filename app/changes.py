@@ -0,0 +1,103 @@
+import json
+import threading
+import time
+
+from flask import current_app
+
+from app.extensions import db
+from app.models import Change
+
+
+class ChangeFeed:
+    """Append-only log of artefact changes with long-poll support.
+
+    ``record`` only adds the change to the current session, so it is
+    committed in the same transaction as the artefact itself. Call
+    ``notify`` after the commit to wake waiting clients in this process;
+    waiters also re-check the log every ``CHANGES_POLL_INTERVAL`` seconds
+    to pick up changes made by other processes.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CHANGES_MAX_WAIT', 30)
+        app.config.setdefault('CHANGES_POLL_INTERVAL', 1.0)
+        app.config.setdefault('CHANGES_PAGE_SIZE', 500)
+        app.extensions['change_feed'] = threading.Condition()
+
+    @staticmethod
+    def _condition():
+        return current_app.extensions['change_feed']
+
+    def record(self, action, artefact, previous_path=None):
+        """Add a change for ``artefact`` to the current session."""
+
+        db.session.add(Change(
+            action=action,
+            artefact_id=artefact.id,
+            path=artefact.path,
+            previous_path=previous_path,
+        ))
+
+    def notify(self):
+        """Wake clients waiting for new changes."""
+
+        condition = self._condition()
+        with condition:
+            condition.notify_all()
+
+    def fetch(self, since, prefix=None):
+        """Return changes after ``since`` under ``prefix`` and the next cursor.
+
+        The cursor moves past changes outside ``prefix`` too, so a client
+        filtering on a quiet directory does not rescan the rest of the log.
+        """
+
+        head = db.session.query(db.func.max(Change.seq)).scalar() or 0
+        query = Change.query.filter(Change.seq > since, Change.seq <= head)
+        prefix = (prefix or '').strip('/')
+        if prefix:
+            query = query.filter(db.or_(
+                Change.path.startswith(prefix + '/', autoescape=True),
+                Change.previous_path.startswith(prefix + '/', autoescape=True),
+            ))
+
+        page_size = current_app.config['CHANGES_PAGE_SIZE']
+        changes = query.order_by(Change.seq).limit(page_size).all()
+        next_seq = changes[-1].seq if len(changes) == page_size else max(head, since)
+        return changes, next_seq
+
+    def wait(self, since, prefix=None, timeout=0):
+        """Like ``fetch``, but block up to ``timeout`` seconds for a change."""
+
+        deadline = time.monotonic() + min(timeout, current_app.config['CHANGES_MAX_WAIT'])
+        condition = self._condition()
+
+        while True:
+            changes, next_seq = self.fetch(since, prefix)
+            remaining = deadline - time.monotonic()
+            if changes or remaining <= 0:
+                return changes, next_seq
+
+            since = next_seq
+            # End the read transaction so the next fetch sees new commits.
+            db.session.close()
+            with condition:
+                condition.wait(min(remaining, current_app.config['CHANGES_POLL_INTERVAL']))
+
+    def stream(self, since, prefix=None):
+        """Yield changes as Server-Sent Events, with keep-alive comments when idle."""
+
+        while True:
+            changes, since = self.wait(since, prefix, current_app.config['CHANGES_MAX_WAIT'])
+            if not changes:
+                yield ': keepalive\n\n'
+            for change in changes:
+                yield f"id: {change.seq}\nevent: {change.action}\ndata: {json.dumps(change.to_dict())}\n\n"
+            db.session.close()
+
+
+change_feed = ChangeFeed()
@@ -1,3 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
 
+from app.admission import AdmissionController
+from app.cache import HotFileCache
+
 db = SQLAlchemy()
+admission = AdmissionController()
+hot_cache = HotFileCache()
@@ -10,3 +10,25 @@ class Artefact(db.Model):
 
     def __str__(self):
         return f"{self.id} -> {self.name}"
+
+
+class Change(db.Model):
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    action = db.Column(db.String(20), nullable=False)
+    artefact_id = db.Column(db.Integer, nullable=False)
+    path = db.Column(db.String(300), nullable=False, index=True)
+    previous_path = db.Column(db.String(300), nullable=True)
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'seq': self.seq,
+            'action': self.action,
+            'artefact_id': self.artefact_id,
+            'path': self.path,
+            'previous_path': self.previous_path,
+            'changed_at': self.changed_at.isoformat(),
+        }
+
+    def __str__(self):
+        return f"{self.seq} -> {self.action} {self.path}"
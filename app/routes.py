@@ -1,11 +1,13 @@
+import math
 import os
 
-from flask import Blueprint, request, jsonify, send_from_directory, current_app
+from flask import Blueprint, Response, request, jsonify, send_from_directory, current_app, stream_with_context
 from datetime import datetime
 from werkzeug.utils import secure_filename
 from pathlib import Path
 
-from app.extensions import db
+from app.changes import change_feed
+from app.extensions import db, admission, hot_cache
 from app.models import Artefact
 
 main = Blueprint('main', __name__)
@@ -19,6 +21,56 @@ def is_safe_path(basedir: Path, path: Path) -> bool:
     return basedir in path.parents or basedir == path
 
 
+@main.route('/admission', methods=['GET'])
+def admission_status():
+    """Show current occupancy and limits of the admission controller."""
+
+    return jsonify(admission.occupancy()), 200
+
+
+@main.route('/changes', methods=['GET'])
+def list_changes():
+    """List artefact changes after a sequence number.
+
+    Waits up to `wait` seconds for a change when there is none yet, or
+    streams changes as Server-Sent Events if the client accepts them.
+    """
+
+    event_stream = request.accept_mimetypes.best == 'text/event-stream'
+
+    since = request.args.get('since', '0')
+    if event_stream:
+        since = request.headers.get('Last-Event-ID', since)
+
+    try:
+        since = int(since)
+    except ValueError:
+        return jsonify(error="Invalid since sequence number"), 400
+
+    if since < 0:
+        return jsonify(error="Invalid since sequence number"), 400
+
+    prefix = request.args.get('dir')
+
+    if event_stream:
+        return Response(
+            stream_with_context(change_feed.stream(since, prefix)),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache'},
+        )
+
+    try:
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        return jsonify(error="Invalid wait timeout"), 400
+
+    if not math.isfinite(wait) or wait < 0:
+        return jsonify(error="Invalid wait timeout"), 400
+
+    changes, next_seq = change_feed.wait(since, prefix, wait)
+    return jsonify(changes=[change.to_dict() for change in changes], next=next_seq), 200
+
+
 @main.route('/artefacts/', methods=['GET'])
 def list_all_directories():
     """List all directories."""
@@ -61,6 +113,7 @@ in exercitiu ruta era /artefacts/<path:directory>/<artefact_id>
 dar id-ul il genereaza baza de date, nu clientul, asa ca am schimbat in /artefacts/<path:directory>
 """
 @main.route('/artefacts/<path:directory>', methods=['POST'])
+@admission.limit('upload')
 def upload_artefact(directory):
     """Upload an artefact file."""
 
@@ -82,6 +135,7 @@ def upload_artefact(directory):
     filename = secure_filename(file.filename)
     file_path = safe_directory / filename
     file.save(file_path)
+    hot_cache.invalidate_path(str(file_path.relative_to(base_upload_dir)))
 
     new_artefact = Artefact(
         name=filename,
@@ -89,12 +143,16 @@ def upload_artefact(directory):
         uploaded_at=datetime.utcnow(),
     )
     db.session.add(new_artefact)
+    db.session.flush()
+    change_feed.record('upload', new_artefact)
     db.session.commit()
+    change_feed.notify()
 
     return jsonify(message="File uploaded successfully", id=new_artefact.id), 201
 
 
 @main.route('/artefact/<path:directory>/<int:artefact_id>', methods=['GET'])
+@admission.limit('download', charge='response')
 def fetch_artefact(directory, artefact_id):
     """Fetch an existing artefact."""
 
@@ -102,6 +160,11 @@ def fetch_artefact(directory, artefact_id):
     if not artefact or not artefact.path.startswith(directory):
         return jsonify(error="Artefact not found in the specified directory"), 404
 
+    if os.path.dirname(artefact.path) == directory:
+        response = hot_cache.get(artefact.id, artefact.path, artefact.uploaded_at)
+        if response is not None:
+            return response
+
     base_upload_dir = Path(current_app.config['BASE_UPLOAD_DIR']).resolve()
     file_path = (base_upload_dir / artefact.path).resolve()
 
@@ -109,6 +172,10 @@ def fetch_artefact(directory, artefact_id):
     if not is_safe_path(base_upload_dir, file_path) or file_path.parent != directory_path:
         return jsonify(error="Artefact does not belong to the specified directory"), 400
 
+    response = hot_cache.serve(artefact.id, artefact.path, artefact.uploaded_at, file_path)
+    if response is not None:
+        return response
+
     return send_from_directory(file_path.parent, file_path.name)
 
 
@@ -126,8 +193,11 @@ def delete_artefact(directory, artefact_id):
     if file_path.exists():
         file_path.unlink()
 
+    hot_cache.invalidate(artefact.id)
+    change_feed.record('delete', artefact)
     db.session.delete(artefact)
     db.session.commit()
+    change_feed.notify()
     return jsonify(message="File deleted successfully"), 202
 
 
@@ -155,8 +225,11 @@ def delete_directory(directory):
 
     db_artifacts = Artefact.query.filter(Artefact.path.in_(artifacts_to_delete)).all()
     for artifact in db_artifacts:
+        hot_cache.invalidate(artifact.id)
+        change_feed.record('delete', artifact)
         db.session.delete(artifact)
     db.session.commit()
+    change_feed.notify()
 
     safe_directory.rmdir()
 
@@ -164,6 +237,7 @@ def delete_directory(directory):
 
 
 @main.route('/artefact/<path:directory>/<int:artefact_id>', methods=['PUT'])
+@admission.limit('upload')
 def replace_artefact(directory, artefact_id):
     """Replace an existing artefact."""
 
@@ -192,10 +266,15 @@ def replace_artefact(directory, artefact_id):
         old_file_path.unlink()
 
     file.save(file_path)
+    hot_cache.invalidate(artefact.id)
+    hot_cache.invalidate_path(str(file_path.relative_to(base_upload_dir)))
 
+    previous_path = artefact.path
     artefact.name = filename
     artefact.path = str(file_path.relative_to(base_upload_dir))
     artefact.uploaded_at = datetime.utcnow()
+    change_feed.record('replace', artefact, previous_path=previous_path)
     db.session.commit()
+    change_feed.notify()
 
     return jsonify(message="Artefact replaced successfully"), 200
@@ -115,3 +115,84 @@ def test_replace_artefact(client, app_fixture):
     fetch_response = client.get(f'/artefact/test_directory/{artefact_id}')
     assert fetch_response.status_code == 200
     assert fetch_response.data == b'replaced content'
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize('replacement_filename', ['cached_replace.txt', 'cached_replace_v2.txt'])
+def test_replace_artefact_invalidates_hot_cache(client, app_fixture, replacement_filename):
+    """Test that fetching after a replace returns the new content of a cached artefact"""
+
+    upload_data = {
+        'file': FileStorage(
+            stream=io.BytesIO(b'original content'),
+            filename='cached_replace.txt',
+            content_type='text/plain'
+        )
+    }
+    upload_response = client.post('/artefacts/test_directory', data=upload_data, content_type='multipart/form-data')
+    assert upload_response.status_code == 201
+    artefact_id = upload_response.json['id']
+
+    fetch_response = client.get(f'/artefact/test_directory/{artefact_id}')
+    assert fetch_response.status_code == 200
+    assert fetch_response.data == b'original content'
+
+    replace_data = {
+        'file': FileStorage(
+            stream=io.BytesIO(b'replaced content'),
+            filename=replacement_filename,
+            content_type='text/plain'
+        )
+    }
+    replace_response = client.put(f'/artefact/test_directory/{artefact_id}', data=replace_data, content_type='multipart/form-data')
+    assert replace_response.status_code == 200
+
+    fetch_response = client.get(f'/artefact/test_directory/{artefact_id}')
+    assert fetch_response.status_code == 200
+    assert fetch_response.data == b'replaced content'
+
+
+@pytest.mark.integration
+def test_change_feed_after_upload_replace_and_delete(client, app_fixture):
+    """Test that uploads, replaces and deletes appear in the change feed in order"""
+
+    upload_ids = []
+    for directory in ['feed_directory', 'other_directory']:
+        upload_data = {
+            'file': FileStorage(
+                stream=io.BytesIO(b'feed content'),
+                filename='feed.txt',
+                content_type='text/plain'
+            )
+        }
+        response = client.post(f'/artefacts/{directory}', data=upload_data, content_type='multipart/form-data')
+        assert response.status_code == 201
+        upload_ids.append(response.json['id'])
+
+    replace_data = {
+        'file': FileStorage(
+            stream=io.BytesIO(b'replaced feed content'),
+            filename='feed_v2.txt',
+            content_type='text/plain'
+        )
+    }
+    replace_response = client.put(f'/artefact/feed_directory/{upload_ids[0]}', data=replace_data, content_type='multipart/form-data')
+    assert replace_response.status_code == 200
+
+    delete_response = client.delete(f'/artefact/other_directory/{upload_ids[1]}')
+    assert delete_response.status_code == 202
+
+    changes_response = client.get('/changes?since=0')
+    assert changes_response.status_code == 200
+    changes = changes_response.json['changes']
+    assert [change['action'] for change in changes] == ['upload', 'upload', 'replace', 'delete']
+    assert [change['artefact_id'] for change in changes] == [upload_ids[0], upload_ids[1], upload_ids[0], upload_ids[1]]
+    assert changes[2]['previous_path'] == os.path.join('feed_directory', 'feed.txt')
+    assert changes_response.json['next'] == changes[-1]['seq']
+
+    filtered_response = client.get('/changes?since=0&dir=feed_directory')
+    assert [change['action'] for change in filtered_response.json['changes']] == ['upload', 'replace']
+    assert filtered_response.json['next'] == changes[-1]['seq']
+
+    next_response = client.get(f"/changes?since={changes_response.json['next']}")
+    assert next_response.json['changes'] == []
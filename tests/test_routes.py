@@ -1,8 +1,10 @@
 import os
+from datetime import datetime, timedelta
 from pathlib import Path
 
 import pytest
 from app import db
+from app.extensions import hot_cache
 from app.models import Artefact
 from werkzeug.datastructures import FileStorage
 import io
@@ -301,3 +303,398 @@ def test_replace_existing_artefact(client, app_fixture):
         expected_path = os.path.join('replace_directory', 'replace_existing.txt')
         assert updated_artefact.path == expected_path
 
+
+
+@pytest.mark.unit
+def test_upload_rejected_over_concurrency_limit(client, app_fixture):
+    """Test that an upload over the concurrency limit is rejected with Retry-After"""
+
+    app_fixture.config['ADMISSION_LIMITS'] = {'upload': {'max_concurrency': 0}}
+    app_fixture.config['ADMISSION_RETRY_AFTER'] = 3
+
+    upload_data = {
+        'file': FileStorage(
+            stream=io.BytesIO(b'rejected content'),
+            filename='rejected.txt',
+            content_type='text/plain'
+        )
+    }
+    response = client.post('/artefacts/admission_directory', data=upload_data, content_type='multipart/form-data')
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '3'
+    assert not os.path.exists(os.path.join(app_fixture.config['BASE_UPLOAD_DIR'], 'admission_directory'))
+
+
+@pytest.mark.unit
+def test_upload_rejected_over_client_byte_rate(client, app_fixture):
+    """Test that a client exceeding its byte rate gets a 429 on the next upload"""
+
+    app_fixture.config['ADMISSION_LIMITS'] = {'upload': {'bytes_per_second_per_client': 100}}
+
+    for expected_status in (201, 429):
+        upload_data = {
+            'file': FileStorage(
+                stream=io.BytesIO(b'x' * 1000),
+                filename='rate_limited.txt',
+                content_type='text/plain'
+            )
+        }
+        response = client.post('/artefacts/rate_directory', data=upload_data, content_type='multipart/form-data')
+        assert response.status_code == expected_status
+
+    assert int(response.headers['Retry-After']) >= 9
+
+
+@pytest.mark.unit
+def test_admission_occupancy_released(client, app_fixture):
+    """Test that admission slots are released once the response is sent"""
+
+    upload_data = {
+        'file': FileStorage(
+            stream=io.BytesIO(b'occupancy content'),
+            filename='occupancy.txt',
+            content_type='text/plain'
+        )
+    }
+    upload_response = client.post('/artefacts/occupancy_directory', data=upload_data, content_type='multipart/form-data')
+    assert upload_response.status_code == 201
+    upload_response.close()
+
+    fetch_response = client.get(f"/artefact/occupancy_directory/{upload_response.json['id']}")
+    assert fetch_response.status_code == 200
+    fetch_response.close()
+
+    response = client.get('/admission')
+    assert response.status_code == 200
+    assert response.json['upload']['active'] == 0
+    assert response.json['download']['active'] == 0
+    assert response.json['upload']['limits']['max_concurrency'] == 8
+
+
+@pytest.mark.unit
+def test_upload_without_content_length_rejected_under_byte_rate(client, app_fixture):
+    """Test that an upload without Content-Length is rejected while a byte rate is set"""
+
+    app_fixture.config['ADMISSION_LIMITS'] = {'upload': {'bytes_per_second': 1000}}
+
+    response = client.post(
+        '/artefacts/chunked_directory',
+        input_stream=io.BytesIO(b'chunked content'),
+        content_type='multipart/form-data; boundary=x',
+        headers={'Transfer-Encoding': 'chunked'}
+    )
+
+    assert response.status_code == 411
+    assert response.json['error'] == "Content-Length required"
+
+
+@pytest.mark.unit
+def test_download_byte_rate_charged_with_file_size(client, app_fixture):
+    """Test that downloads are charged with the bytes sent and uploads only with the request body"""
+
+    app_fixture.config['ADMISSION_LIMITS'] = {
+        'upload': {'bytes_per_second': 100000},
+        'download': {'bytes_per_second_per_client': 100},
+    }
+
+    upload_data = {
+        'file': FileStorage(
+            stream=io.BytesIO(b'x' * 1000),
+            filename='download_rate.txt',
+            content_type='text/plain'
+        )
+    }
+    upload_response = client.post('/artefacts/download_rate_directory', data=upload_data, content_type='multipart/form-data')
+    assert upload_response.status_code == 201
+
+    upload_bucket = app_fixture.extensions['admission']['buckets'][('upload', None)]
+    assert 100000 - upload_bucket.tokens == pytest.approx(upload_response.request.content_length, abs=1)
+
+    artefact_id = upload_response.json['id']
+    first_response = client.get(f'/artefact/download_rate_directory/{artefact_id}')
+    assert first_response.status_code == 200
+    first_response.close()
+
+    second_response = client.get(f'/artefact/download_rate_directory/{artefact_id}')
+    assert second_response.status_code == 429
+    assert int(second_response.headers['Retry-After']) >= 9
+
+
+@pytest.mark.unit
+def test_refilled_buckets_are_swept(client, app_fixture):
+    """Test that per-client buckets are dropped once they have refilled"""
+
+    app_fixture.config['ADMISSION_LIMITS'] = {'upload': {'bytes_per_second_per_client': 10 ** 9}}
+    app_fixture.config['ADMISSION_SWEEP_INTERVAL'] = 0
+
+    upload_data = {
+        'file': FileStorage(
+            stream=io.BytesIO(b'sweep content'),
+            filename='sweep.txt',
+            content_type='text/plain'
+        )
+    }
+    response = client.post('/artefacts/sweep_directory', data=upload_data, content_type='multipart/form-data')
+    assert response.status_code == 201
+
+    assert not app_fixture.extensions['admission']['buckets']
+
+
+@pytest.mark.unit
+def test_streamed_download_charged_before_body_is_sent(client, app_fixture):
+    """Test that a download still streaming counts against the client's byte rate"""
+
+    app_fixture.config['ADMISSION_LIMITS'] = {'download': {'bytes_per_second_per_client': 100}}
+    app_fixture.config['HOT_CACHE_MAX_FILE_SIZE'] = 0
+
+    with app_fixture.app_context():
+        artefact = Artefact(name='stream_rate.txt', path='stream_rate_directory/stream_rate.txt')
+        db.session.add(artefact)
+        db.session.commit()
+        artefact_id = artefact.id
+
+    dir_path = os.path.join(app_fixture.config['BASE_UPLOAD_DIR'], 'stream_rate_directory')
+    os.makedirs(dir_path, exist_ok=True)
+    with open(os.path.join(dir_path, 'stream_rate.txt'), 'wb') as f:
+        f.write(b'x' * 1000)
+
+    first_response = client.get(f'/artefact/stream_rate_directory/{artefact_id}', buffered=False)
+    assert first_response.status_code == 200
+
+    second_response = client.get(f'/artefact/stream_rate_directory/{artefact_id}', buffered=False)
+    assert second_response.status_code == 429
+    assert 9 <= int(second_response.headers['Retry-After']) <= 10
+
+    first_response.close()
+
+@pytest.mark.unit
+def test_fetch_artefact_served_from_hot_cache(client, app_fixture, monkeypatch):
+    """Test that a small artefact is served from memory after the first fetch"""
+
+    with app_fixture.app_context():
+        artefact = Artefact(name='hot.txt', path='hot_directory/hot.txt')
+        db.session.add(artefact)
+        db.session.commit()
+        artefact_id = artefact.id
+
+    dir_path = os.path.join(app_fixture.config['BASE_UPLOAD_DIR'], 'hot_directory')
+    os.makedirs(dir_path, exist_ok=True)
+    file_path = os.path.join(dir_path, 'hot.txt')
+    with open(file_path, 'w') as f:
+        f.write('hot content')
+
+    first_response = client.get(f'/artefact/hot_directory/{artefact_id}')
+    assert first_response.status_code == 200
+    assert first_response.data == b'hot content'
+    etag = first_response.headers['ETag']
+
+    os.remove(file_path)
+
+    def no_filesystem_access(path, *args, **kwargs):
+        raise AssertionError(f"filesystem accessed for {path}")
+
+    monkeypatch.setattr(Path, 'resolve', no_filesystem_access)
+    monkeypatch.setattr(Path, 'stat', no_filesystem_access)
+
+    second_response = client.get(f'/artefact/hot_directory/{artefact_id}')
+    assert second_response.status_code == 200
+    assert second_response.data == b'hot content'
+
+    conditional_response = client.get(f'/artefact/hot_directory/{artefact_id}', headers={'If-None-Match': etag})
+    assert conditional_response.status_code == 304
+
+
+@pytest.mark.unit
+def test_fetch_large_artefact_bypasses_hot_cache(client, app_fixture):
+    """Test that artefacts over the size threshold are not cached"""
+
+    app_fixture.config['HOT_CACHE_MAX_FILE_SIZE'] = 4
+
+    with app_fixture.app_context():
+        artefact = Artefact(name='large.txt', path='large_directory/large.txt')
+        db.session.add(artefact)
+        db.session.commit()
+        artefact_id = artefact.id
+
+    dir_path = os.path.join(app_fixture.config['BASE_UPLOAD_DIR'], 'large_directory')
+    os.makedirs(dir_path, exist_ok=True)
+    file_path = os.path.join(dir_path, 'large.txt')
+    with open(file_path, 'w') as f:
+        f.write('large content')
+
+    response = client.get(f'/artefact/large_directory/{artefact_id}')
+    assert response.status_code == 200
+    assert response.data == b'large content'
+    response.close()
+
+    assert not app_fixture.extensions['hot_cache']['entries']
+
+
+@pytest.mark.unit
+def test_fetch_cached_artefact_range(client, app_fixture):
+    """Test that Range requests are honoured for cached artefacts"""
+
+    with app_fixture.app_context():
+        artefact = Artefact(name='range.txt', path='range_directory/range.txt')
+        db.session.add(artefact)
+        db.session.commit()
+        artefact_id = artefact.id
+
+    dir_path = os.path.join(app_fixture.config['BASE_UPLOAD_DIR'], 'range_directory')
+    os.makedirs(dir_path, exist_ok=True)
+    with open(os.path.join(dir_path, 'range.txt'), 'wb') as f:
+        f.write(b'0123456789')
+
+    for _ in range(2):
+        response = client.get(f'/artefact/range_directory/{artefact_id}', headers={'Range': 'bytes=0-3'})
+        assert response.status_code == 206
+        assert response.data == b'0123'
+        assert response.headers['Content-Range'] == 'bytes 0-3/10'
+
+    assert artefact_id in app_fixture.extensions['hot_cache']['entries']
+
+
+@pytest.mark.unit
+def test_hot_cache_skips_insert_invalidated_during_read(client, app_fixture, monkeypatch):
+    """Test that a file replaced while it is being read is not left in the cache"""
+
+    with app_fixture.app_context():
+        artefact = Artefact(name='race.txt', path='race_directory/race.txt')
+        db.session.add(artefact)
+        db.session.commit()
+        artefact_id = artefact.id
+
+    dir_path = Path(app_fixture.config['BASE_UPLOAD_DIR']) / 'race_directory'
+    dir_path.mkdir(parents=True, exist_ok=True)
+    file_path = dir_path / 'race.txt'
+    file_path.write_bytes(b'0123456789')
+
+    read_bytes = Path.read_bytes
+
+    def read_then_replace(path):
+        data = read_bytes(path)
+        monkeypatch.setattr(Path, 'read_bytes', read_bytes)
+        file_path.write_bytes(b'NEW')
+        hot_cache.invalidate(artefact_id)
+        return data
+
+    monkeypatch.setattr(Path, 'read_bytes', read_then_replace)
+
+    first_response = client.get(f'/artefact/race_directory/{artefact_id}')
+    assert first_response.data == b'0123456789'
+    assert artefact_id not in app_fixture.extensions['hot_cache']['entries']
+
+    second_response = client.get(f'/artefact/race_directory/{artefact_id}')
+    assert second_response.data == b'NEW'
+
+
+@pytest.mark.unit
+def test_hot_cache_detects_replace_from_another_process(client, app_fixture):
+    """Test that a cached artefact replaced without invalidating this cache is reloaded"""
+
+    with app_fixture.app_context():
+        artefact = Artefact(name='shared.txt', path='shared_directory/shared.txt')
+        db.session.add(artefact)
+        db.session.commit()
+        artefact_id = artefact.id
+
+    dir_path = Path(app_fixture.config['BASE_UPLOAD_DIR']) / 'shared_directory'
+    dir_path.mkdir(parents=True, exist_ok=True)
+    file_path = dir_path / 'shared.txt'
+    file_path.write_bytes(b'old content')
+
+    first_response = client.get(f'/artefact/shared_directory/{artefact_id}')
+    assert first_response.data == b'old content'
+
+    file_path.write_bytes(b'new content')
+    with app_fixture.app_context():
+        artefact = db.session.get(Artefact, artefact_id)
+        artefact.uploaded_at = datetime.utcnow() + timedelta(seconds=1)
+        db.session.commit()
+
+    second_response = client.get(f'/artefact/shared_directory/{artefact_id}')
+    assert second_response.data == b'new content'
+
+@pytest.mark.unit
+def test_changes_long_poll_times_out_without_changes(client, app_fixture):
+    """Test that a long-poll with no new changes returns an empty page after waiting"""
+
+    app_fixture.config['CHANGES_POLL_INTERVAL'] = 0.05
+
+    response = client.get('/changes?since=0&wait=0.1')
+
+    assert response.status_code == 200
+    assert response.json['changes'] == []
+    assert response.json['next'] == 0
+
+
+@pytest.mark.unit
+def test_changes_event_stream(client, app_fixture):
+    """Test streaming changes as Server-Sent Events"""
+
+    upload_data = {
+        'file': FileStorage(
+            stream=io.BytesIO(b'stream content'),
+            filename='stream.txt',
+            content_type='text/plain'
+        )
+    }
+    upload_response = client.post('/artefacts/stream_directory', data=upload_data, content_type='multipart/form-data')
+    assert upload_response.status_code == 201
+
+    response = client.get('/changes?since=0', headers={'Accept': 'text/event-stream'}, buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+
+    event = next(response.response).decode()
+    response.close()
+
+    assert event.startswith('id: 1\nevent: upload\n')
+    assert '"path": "stream_directory/stream.txt"' in event
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('query, error', [
+    ('since=abc', "Invalid since sequence number"),
+    ('since=-1', "Invalid since sequence number"),
+    ('wait=nan', "Invalid wait timeout"),
+    ('wait=inf', "Invalid wait timeout"),
+    ('wait=-1', "Invalid wait timeout"),
+])
+def test_changes_invalid_parameters(client, app_fixture, query, error):
+    """Test that malformed since and wait parameters are rejected"""
+
+    response = client.get(f'/changes?{query}')
+
+    assert response.status_code == 400
+    assert response.json['error'] == error
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('prefix, expected_paths', [
+    ('/', ['prefix_directory/nested/a.txt', 'other_prefix_directory/b.txt']),
+    ('', ['prefix_directory/nested/a.txt', 'other_prefix_directory/b.txt']),
+    ('prefix_directory', ['prefix_directory/nested/a.txt']),
+    ('/prefix_directory/', ['prefix_directory/nested/a.txt']),
+    ('prefix_directory/nested', ['prefix_directory/nested/a.txt']),
+    ('prefix', []),
+])
+def test_changes_directory_prefix(client, app_fixture, prefix, expected_paths):
+    """Test filtering changes by directory prefix"""
+
+    for directory, file_name in [('prefix_directory/nested', 'a.txt'), ('other_prefix_directory', 'b.txt')]:
+        upload_data = {
+            'file': FileStorage(
+                stream=io.BytesIO(b'prefix content'),
+                filename=file_name,
+                content_type='text/plain'
+            )
+        }
+        response = client.post(f'/artefacts/{directory}', data=upload_data, content_type='multipart/form-data')
+        assert response.status_code == 201
+
+    response = client.get('/changes', query_string={'since': 0, 'dir': prefix})
+
+    assert response.status_code == 200
+    assert [change['path'] for change in response.json['changes']] == expected_paths